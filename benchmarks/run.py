@@ -0,0 +1,300 @@
+"""End-to-end benchmark of the search, summary and rendering paths.
+
+Steam, the Neon database and the Mistral agent are replaced by local
+stand-ins (see ``stub_server.py`` and ``stand_ins.py``), so runs are
+repeatable and can be compared with each other. From the repository root:
+
+    python -m benchmarks.run --iterations 50 --concurrency 1,8 --output new.json
+    python -m benchmarks.run --output new.json --baseline old.json
+
+The report is JSON with p50/p95/p99 latency and throughput per scenario and
+concurrency level. With ``--baseline`` the run is compared against a previous
+report and the exit status is 1 if any scenario has more errors, or its p95
+latency or throughput got worse by more than ``--max-regression``.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+
+import metrics
+import utils
+from benchmarks.stand_ins import FakeAgent, NullStatus, SQLiteConnection
+from benchmarks.stub_server import SteamStub
+
+SCENARIOS = ("search", "summary_cold", "summary_warm", "render")
+SEARCH_QUERIES = ("portal", "half life", "counter strike", "witcher", "dark souls", "baldurs gate",
+                  "resident evil", "total war", "grand theft auto", "hollow knight")
+WARM_APPIDS = [str(appid) for appid in range(1000, 1020)]
+RENDER_APPID = "400"
+
+
+def uncached(func):
+    """Return the function under the ``st.cache_data`` decorator of ``func``."""
+    while hasattr(func, "__wrapped__"):
+        if hasattr(func, "clear") and not hasattr(func.__wrapped__, "clear"):
+            return func.__wrapped__
+        func = func.__wrapped__
+    return func
+
+
+class Benchmark:
+    """Points the app at the stand-ins and holds the state shared by scenarios."""
+
+    def __init__(self, stub, connection, agent, retry_wait=0.05):
+        self.stub = stub
+        self.connection = connection
+        self.agent = agent
+        self.retry_wait = retry_wait
+        self.cold_appids = itertools.count(10_000_000)
+        self.header = None
+        self.summary = None
+
+    def install(self):
+        utils.STEAM_STORE_URL = self.stub.base_url
+        utils.STEAM_API_URL = self.stub.base_url
+        utils.STEAM_APPDETAILS_URL = self.stub.base_url
+        utils.RETRY_WAIT = self.retry_wait
+        utils.get_connection = lambda: self.connection
+        utils.get_client = lambda: self.agent
+        utils.get_agent_id = lambda: "benchmark-agent"
+
+    def prepare(self):
+        # Injected errors are meant for the timed runs, not for seeding them.
+        with self.stub.without_errors():
+            for appid in WARM_APPIDS:
+                self.summarise(appid)
+            self.header = utils.get_header_image(RENDER_APPID)
+            self.summary = utils.get_summary(RENDER_APPID)
+        if self.header is None:
+            raise RuntimeError(f"could not fetch the header image of appid {RENDER_APPID} from {self.stub.base_url}")
+
+    def summarise(self, appid):
+        total_reviews = utils.get_summary(appid)["total_reviews"]
+        return utils.manage_summary_by_appid(appid, total_reviews, NullStatus())
+
+    def search(self, i):
+        return uncached(utils.get_steam_df_search)(SEARCH_QUERIES[i % len(SEARCH_QUERIES)])
+
+    def summary_cold(self, i):
+        return self.summarise(str(next(self.cold_appids)))
+
+    def summary_warm(self, i):
+        return self.summarise(WARM_APPIDS[i % len(WARM_APPIDS)])
+
+    def render(self, i):
+        img = utils.add_summary_text_image(self.header, self.summary)
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+
+def percentile(sorted_values, q):
+    """Return the q-th percentile (0-100) of sorted values, interpolating linearly."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    weight = position - lower
+    return sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight
+
+
+def run_scenario(func, iterations, concurrency):
+    """Call ``func(i)`` ``iterations`` times from ``concurrency`` threads.
+
+    Returns
+    -------
+    dict
+        latency percentiles in milliseconds, throughput and error count
+    """
+    def timed_call(i):
+        start = time.perf_counter()
+        try:
+            func(i)
+        except Exception as e:
+            return time.perf_counter() - start, f"{type(e).__name__}: {e}"
+        return time.perf_counter() - start, None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        calls = list(pool.map(timed_call, range(iterations)))
+    wall_time = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for latency, error in calls if error is None)
+    errors = [error for _, error in calls if error is not None]
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_time_s": wall_time,
+        "throughput_rps": len(latencies) / wall_time if wall_time else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "max": latencies[-1] if latencies else None,
+        },
+    }
+
+
+def stage_totals(snapshot):
+    """Sum the per-appid counters of a metrics snapshot by stage."""
+    totals = {}
+    for counter in snapshot["counters"]:
+        stage = totals.setdefault(counter["labels"]["stage"], {})
+        stage[counter["name"]] = stage.get(counter["name"], 0) + counter["value"]
+    for histogram in snapshot["histograms"]:
+        if histogram["name"] != "stage_latency_seconds":
+            continue
+        stage = totals.setdefault(histogram["labels"]["stage"], {})
+        stage["latency_seconds_sum"] = stage.get("latency_seconds_sum", 0) + histogram["sum"]
+    for stage, rate in snapshot["cache_hit_rate"].items():
+        totals.setdefault(stage, {})["cache_hit_rate"] = rate
+    return totals
+
+
+def compare(baseline, current, max_regression):
+    """Compare two reports and return the list of regressions found."""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        key = (result["scenario"], result["concurrency"])
+        old = previous.get(key)
+        if old is None:
+            continue
+        old_p95, new_p95 = old["latency_ms"]["p95"], result["latency_ms"]["p95"]
+        old_rps, new_rps = old["throughput_rps"], result["throughput_rps"]
+        old_errors, new_errors = old["errors"], result["errors"]
+        print(f"{key[0]:>14} x{key[1]:<3} p95 {_fmt(old_p95)} -> {_fmt(new_p95)} ms, "
+              f"throughput {_fmt(old_rps)} -> {_fmt(new_rps)} rps, "
+              f"errors {old_errors} -> {new_errors}", file=sys.stderr)
+        # Percentiles only cover successful calls, so failing fast could look like a speedup.
+        if new_errors > old_errors:
+            regressions.append(f"{key[0]} x{key[1]}: errors {old_errors} -> {new_errors}")
+        if old_p95 and new_p95 and new_p95 > old_p95 * (1 + max_regression):
+            regressions.append(f"{key[0]} x{key[1]}: p95 {old_p95:.1f} -> {new_p95:.1f} ms")
+        if old_rps and new_rps is not None and new_rps < old_rps * (1 - max_regression):
+            regressions.append(f"{key[0]} x{key[1]}: throughput {old_rps:.2f} -> {new_rps:.2f} rps")
+    return regressions
+
+
+def _fmt(value):
+    return "n/a" if value is None else f"{value:.1f}"
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated scenarios to run, from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=20, help="timed calls per scenario and concurrency level")
+    parser.add_argument("--concurrency", default="1,4", help="comma-separated numbers of concurrent callers")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed calls before each run")
+    parser.add_argument("--steam-latency-ms", type=float, default=0, help="delay added to every Steam response")
+    parser.add_argument("--steam-jitter-ms", type=float, default=0, help="random extra delay for Steam responses")
+    parser.add_argument("--steam-error-rate", type=float, default=0,
+                        help="fraction of Steam requests failing with 503")
+    parser.add_argument("--steam-retry-wait-ms", type=float, default=50,
+                        help="wait of get_request before retrying a failed request (10s in the app)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="duration of every agent completion")
+    parser.add_argument("--llm-jitter-ms", type=float, default=0, help="random extra duration of completions")
+    parser.add_argument("--llm-empty-rate", type=float, default=0, help="fraction of completions without choices")
+    parser.add_argument("--seed", type=int, default=0, help="seed for injected jitter and errors")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed relative p95/throughput regression against the baseline")
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(n) for n in args.concurrency.split(",")]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Streamlit warns about the missing script run context on every cached call.
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    stub = SteamStub(latency=args.steam_latency_ms / 1000, jitter=args.steam_jitter_ms / 1000,
+                     error_rate=args.steam_error_rate, seed=args.seed)
+    agent = FakeAgent(latency=args.llm_latency_ms / 1000, jitter=args.llm_jitter_ms / 1000,
+                      empty_rate=args.llm_empty_rate, seed=args.seed)
+    connection = SQLiteConnection()
+    results = []
+    # The app prints every review URL and retry; keep the report readable.
+    with stub, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        benchmark = Benchmark(stub, connection, agent, retry_wait=args.steam_retry_wait_ms / 1000)
+        benchmark.install()
+        benchmark.prepare()
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                scenario = getattr(benchmark, name)
+                for i in range(args.warmup):
+                    scenario(i)
+                # Reset after the warmup so the stage metrics cover the timed calls only.
+                metrics.REGISTRY.reset()
+                result = run_scenario(scenario, args.iterations, concurrency)
+                result = dict(scenario=name, **result, stages=stage_totals(metrics.REGISTRY.snapshot()))
+                results.append(result)
+                print(f"{name:>14} x{concurrency:<3} p50 {_fmt(result['latency_ms']['p50'])} ms, "
+                      f"p95 {_fmt(result['latency_ms']['p95'])} ms, p99 {_fmt(result['latency_ms']['p99'])} ms, "
+                      f"{_fmt(result['throughput_rps'])} rps, {result['errors']} errors", file=sys.stderr)
+        steam_requests = dict(stub.requests)
+    connection.close()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": config,
+            "steam_requests": steam_requests,
+            "llm_calls": agent.calls,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from utils import Base
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+class SQLiteConnection:
+    """SQLite stand-in for the Neon connection returned by ``st.connection``.
+
+    Only the ``session`` property used by ``manage_summary_by_appid`` and
+    ``write_bug`` is provided. The ``summaries`` and ``summary_bug`` tables are
+    created from the app's own models.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="steam-reviews-bench-", suffix=".sqlite")
+            os.close(fd)
+            self._owned_path = path
+        else:
+            self._owned_path = None
+        self.path = path
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+        Base.metadata.create_all(self.engine)
+
+    @property
+    def session(self):
+        return Session(self.engine)
+
+    def close(self):
+        self.engine.dispose()
+        if self._owned_path is not None and os.path.exists(self._owned_path):
+            os.remove(self._owned_path)
+
+
+class FakeAgent:
+    """Stand-in for the Mistral client, answering ``agents.complete`` locally.
+
+    Parameters
+    ----------
+    latency : float
+        seconds every completion takes
+    jitter : float
+        extra random delay in seconds, uniform between 0 and ``jitter``
+    empty_rate : float
+        fraction of completions returned without choices, which the app retries
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, empty_rate=0.0, seed=None):
+        self.content = (FIXTURES_DIR / "agent_response.json").read_text()
+        self.latency = latency
+        self.jitter = jitter
+        self.empty_rate = empty_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.agents = self
+
+    def complete(self, agent_id, messages, stream=False, response_format=None):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            empty = self.random.random() < self.empty_rate
+        if delay:
+            time.sleep(delay)
+        if empty:
+            return SimpleNamespace(choices=[])
+        message = SimpleNamespace(role="assistant", content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")])
+
+
+class NullStatus:
+    """Stand-in for the Streamlit placeholder receiving progress messages."""
+
+    def write(self, *args, **kwargs):
+        pass
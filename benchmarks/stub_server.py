@@ -0,0 +1,136 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+def header_jpeg(width=460, height=215):
+    """Return the bytes of a JPEG the size of a Steam header image."""
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class SteamStub:
+    """Local HTTP server replaying recorded Steam responses.
+
+    Serves ``GetAppList``, ``appreviews`` and ``appdetails`` from the fixtures
+    directory, plus the header images they point to, for any appid.
+
+    Parameters
+    ----------
+    latency : float
+        seconds added to every response
+    jitter : float
+        extra random delay in seconds, uniform between 0 and ``jitter``
+    error_rate : float
+        fraction of requests answered with an empty 503, like a throttled Steam
+    """
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        fixtures_dir = Path(fixtures_dir)
+        self.app_list = (fixtures_dir / "GetAppList.json").read_bytes()
+        self.app_reviews = (fixtures_dir / "appreviews.json").read_bytes()
+        self.app_details = json.loads((fixtures_dir / "appdetails.json").read_text())
+        self.header = header_jpeg()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @contextmanager
+    def without_errors(self):
+        """Temporarily disable error injection, e.g. while preparing fixtures."""
+        error_rate = self.error_rate
+        self.error_rate = 0.0
+        try:
+            yield
+        finally:
+            self.error_rate = error_rate
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _route(self, path, query):
+        """Return (route, content type, body) for a request, or None if unknown."""
+        if path.startswith("/ISteamApps/GetAppList"):
+            return "GetAppList", "application/json", self.app_list
+        if path.startswith("/appreviews/"):
+            return "appreviews", "application/json", self.app_reviews
+        if path.startswith("/api/appdetails"):
+            appid = query.get("appids", ["0"])[0]
+            data = dict(self.app_details, steam_appid=int(appid))
+            for key in ("header_image", "capsule_image"):
+                data[key] = data[key].format(base_url=self.base_url, appid=appid)
+            body = json.dumps({appid: {"success": True, "data": data}}).encode()
+            return "appdetails", "application/json", body
+        if path.startswith("/header/") or path.startswith("/capsule/"):
+            return "image", "image/jpeg", self.header
+        return None
+
+    def _handle(self, handler):
+        url = urlparse(handler.path)
+        route = self._route(url.path, parse_qs(url.query))
+        name = route[0] if route else "unknown"
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fail = self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if route is None or fail:
+            handler.send_response(404 if route is None else 503)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        _, content_type, body = route
+        handler.send_response(200)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
@@ -0,0 +1,359 @@
+import cProfile
+import functools
+import inspect
+import json
+import logging
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Latency buckets in seconds, from a cached DB hit up to a slow LLM completion.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Payload buckets in bytes, from a small JSON summary up to a large banner image.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRIC_PREFIX = "steam_reviews_"
+# Distinct appids kept as labels; later ones are folded into appid="other" so
+# a long-lived server does not grow a new series for every game ever searched.
+MAX_APPID_LABELS = 100
+OTHER_APPID = "other"
+
+_current_appid = ContextVar("metrics_appid", default="")
+_active_stages = ContextVar("metrics_active_stages", default=())
+_profiling = ContextVar("metrics_profiling", default=False)
+_cache_probe = ContextVar("metrics_cache_probe", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, Prometheus-style."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self):
+        return {
+            "buckets": {str(bound): n for bound, n in zip(self.buckets, self.counts)},
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters and histograms keyed by name and labels.
+
+    Streamlit runs every session in its own thread and keeps imported modules
+    alive between reruns, so a single module-level registry accumulates data
+    for the whole server process.
+    """
+
+    def __init__(self, max_appids=MAX_APPID_LABELS):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._appids = set()
+        self.max_appids = max_appids
+
+    def appid_label(self, appid):
+        """Return the label for ``appid``, or "other" once the cap is reached."""
+        appid = str(appid)
+        if not appid:
+            return appid
+        with self._lock:
+            if appid in self._appids:
+                return appid
+            if len(self._appids) >= self.max_appids:
+                return OTHER_APPID
+            self._appids.add(appid)
+        return appid
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._appids.clear()
+
+    def snapshot(self):
+        """Return a JSON-serialisable copy of all metrics."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                dict(name=name, labels=dict(labels), **histogram.to_dict())
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+        return {
+            "counters": counters,
+            "histograms": histograms,
+            "cache_hit_rate": _cache_hit_rates(counters),
+        }
+
+    def to_prometheus(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = [
+                (key, (h.buckets, h.counts[:], h.count, h.sum))
+                for key, h in sorted(self._histograms.items())
+            ]
+        lines = []
+        seen = set()
+        for (name, labels), value in counters:
+            full_name = METRIC_PREFIX + name
+            if full_name not in seen:
+                lines.append(f"# TYPE {full_name} counter")
+                seen.add(full_name)
+            lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for (name, labels), (buckets, bucket_counts, total, value_sum) in histograms:
+            full_name = METRIC_PREFIX + name
+            if full_name not in seen:
+                lines.append(f"# TYPE {full_name} histogram")
+                seen.add(full_name)
+            for bound, count in zip(buckets, bucket_counts):
+                bucket_labels = labels + (("le", str(bound)),)
+                lines.append(f"{full_name}_bucket{_format_labels(bucket_labels)} {count}")
+            inf_labels = labels + (("le", "+Inf"),)
+            lines.append(f"{full_name}_bucket{_format_labels(inf_labels)} {total}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {value_sum}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {total}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _cache_hit_rates(counters):
+    totals = {}
+    for counter in counters:
+        if counter["name"] != "cache_requests_total":
+            continue
+        stage = counter["labels"].get("stage", "")
+        hits, total = totals.get(stage, (0, 0))
+        if counter["labels"].get("result") == "hit":
+            hits += counter["value"]
+        totals[stage] = (hits, total + counter["value"])
+    return {stage: hits / total for stage, (hits, total) in totals.items() if total}
+
+
+REGISTRY = MetricsRegistry()
+
+_profiler_hook = None
+_profiler_sample_rate = 0.0
+
+
+def set_profiler(hook=None, sample_rate=0.01):
+    """Profile a random sample of instrumented stages with cProfile.
+
+    Parameters
+    ----------
+    hook : callable(stage, appid, pstats.Stats) or None
+        called with the profile of every sampled stage; None disables profiling
+    sample_rate : float
+        fraction of stage calls to profile, between 0 and 1
+    """
+    global _profiler_hook, _profiler_sample_rate
+    _profiler_hook = hook
+    _profiler_sample_rate = sample_rate if hook is not None else 0.0
+
+
+def current_appid():
+    """Return the appid label of the stage currently running, if any."""
+    return _current_appid.get()
+
+
+def labels_for(stage, appid=None):
+    if appid is None:
+        appid = _current_appid.get()
+    return {"stage": stage, "appid": REGISTRY.appid_label(appid)}
+
+
+def record_retry(stage, appid=None):
+    REGISTRY.inc("retries_total", **labels_for(stage, appid))
+
+
+def record_cache(stage, hit, appid=None):
+    REGISTRY.inc("cache_requests_total", result="hit" if hit else "miss", **labels_for(stage, appid))
+
+
+def record_payload(stage, size, appid=None):
+    REGISTRY.observe("payload_bytes", size, buckets=SIZE_BUCKETS, **labels_for(stage, appid))
+
+
+@contextmanager
+def track(stage, appid=None):
+    """Time a block of code as one call of ``stage``.
+
+    Nested calls of a stage that is already running (the recursive retries in
+    ``get_request`` and ``get_json_response``) are counted as retries instead
+    of being timed twice.
+    """
+    active = _active_stages.get()
+    if stage in active:
+        record_retry(stage)
+        yield
+        return
+    probe = _cache_probe.get()
+    if probe is not None:
+        # Running below a count_cache wrapper: the cached function was a miss.
+        probe.append(stage)
+    probe_token = _cache_probe.set(None)
+    appid_token = _current_appid.set(str(appid)) if appid is not None else None
+    stages_token = _active_stages.set(active + (stage,))
+    labels = labels_for(stage)
+    profiler = _start_profiler()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        REGISTRY.inc("stage_errors_total", **labels)
+        raise
+    finally:
+        REGISTRY.observe("stage_latency_seconds", time.perf_counter() - start, **labels)
+        REGISTRY.inc("stage_calls_total", **labels)
+        stats = _stop_profiler(profiler) if profiler is not None else None
+        _active_stages.reset(stages_token)
+        if appid_token is not None:
+            _current_appid.reset(appid_token)
+        _cache_probe.reset(probe_token)
+        if stats is not None:
+            _call_profiler_hook(labels, stats)
+
+
+def instrument(stage, appid_arg=None):
+    """Decorate a function so each call is tracked as ``stage``.
+
+    Parameters
+    ----------
+    stage : string
+        stage label, e.g. "steam_http" or "llm"
+    appid_arg : string
+        name of the argument holding the appid, used as label for this call
+        and every stage nested inside it
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            appid = None
+            if appid_arg is not None:
+                bound = signature.bind_partial(*args, **kwargs)
+                appid = bound.arguments.get(appid_arg)
+            with track(stage, appid):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_cache(stage, appid_arg=None):
+    """Decorate a ``st.cache_data`` function to count its hits and misses.
+
+    Goes above ``st.cache_data``, with ``instrument`` below it. The cached
+    function only runs on a miss, and its ``instrument`` wrapper marks the
+    probe set up here, so a call that leaves the probe empty was a hit.
+
+    Parameters
+    ----------
+    stage : string
+        stage label of the cache, usually the same as the inner ``instrument``
+    appid_arg : string
+        name of the argument holding the appid, used as label
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            appid = None
+            if appid_arg is not None:
+                appid = signature.bind_partial(*args, **kwargs).arguments.get(appid_arg)
+            probe = []
+            token = _cache_probe.set(probe)
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                _cache_probe.reset(token)
+            record_cache(stage, hit=not probe, appid=appid)
+            return result
+        if hasattr(func, "clear"):
+            wrapper.clear = func.clear
+        return wrapper
+    return decorator
+
+
+def _start_profiler():
+    if _profiler_hook is None or _profiling.get():
+        return None
+    if random.random() >= _profiler_sample_rate:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler (or a debugger) already owns the interpreter.
+        return None
+    return profiler, _profiling.set(True)
+
+
+def _stop_profiler(profiler):
+    profiler, token = profiler
+    profiler.disable()
+    _profiling.reset(token)
+    return pstats.Stats(profiler)
+
+
+def _call_profiler_hook(labels, stats):
+    hook = _profiler_hook
+    if hook is None:
+        return
+    try:
+        hook(labels["stage"], labels["appid"], stats)
+    except Exception:
+        # Diagnostics must never break the instrumented call.
+        logger.exception("Profiler hook failed for stage %s", labels["stage"])
+
+
+def export_prometheus():
+    """Return collected metrics in Prometheus text format."""
+    return REGISTRY.to_prometheus()
+
+
+def export_json(indent=None):
+    """Return collected metrics as a JSON string."""
+    return json.dumps(REGISTRY.snapshot(), indent=indent)
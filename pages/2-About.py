@@ -1,4 +1,20 @@
 import streamlit as st
+import metrics
+
+# Hidden metrics surface: /About?metrics=prometheus&token=... or
+# /About?metrics=json&token=..., only shown when METRICS_TOKEN is set in the
+# secrets and matches.
+if "metrics" in st.query_params:
+    try:
+        token = st.secrets.get("METRICS_TOKEN")
+    except FileNotFoundError:  # no secrets.toml at all
+        token = None
+    if token and st.query_params.get("token") == token:
+        if st.query_params["metrics"] == "json":
+            st.code(metrics.export_json(indent=2), language="json")
+        else:
+            st.code(metrics.export_prometheus(), language="text")
+        st.stop()
 
 st.page_link("Search.py", label=":red-background[**Back to search**]")
 
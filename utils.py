@@ -1,3 +1,4 @@
+import os
 from os import link
 import streamlit as st
 import json
@@ -10,14 +11,26 @@ import re
 import base64
 from io import BytesIO
 from PIL import Image
+from mistralai import Mistral
 from requests.exceptions import SSLError
 from pictex import Canvas, LinearGradient
 from datetime import datetime, timedelta
 from thefuzz import fuzz
 
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Boolean
 from sqlalchemy.orm import declarative_base
 
+import metrics
+
+# Base URLs of the Steam endpoints, overridable to point the app at a local stand-in.
+STEAM_STORE_URL = os.environ.get("STEAM_STORE_URL", "https://store.steampowered.com")
+STEAM_API_URL = os.environ.get("STEAM_API_URL", "https://api.steampowered.com")
+# appdetails (header and capsule images) is fetched over plain http.
+STEAM_APPDETAILS_URL = os.environ.get("STEAM_APPDETAILS_URL", "http://store.steampowered.com")
+# Seconds get_request waits before retrying after an empty or failed response.
+RETRY_WAIT = 10
+
+@metrics.instrument("render_text_image")
 def text_to_image(text, alignment="left", line_height=1.1):
     canvas = (
     Canvas()
@@ -34,6 +47,10 @@ def text_to_image(text, alignment="left", line_height=1.1):
     return img
 
 def add_summary_text_image(header, summary, score=None):
+    with metrics.track("render_summary_image", appid=summary['appid']):
+        return _add_summary_text_image(header, summary, score)
+
+def _add_summary_text_image(header, summary, score=None):
     img = header.copy()
     width, height = img.size
     # Create a text image with the summary
@@ -65,6 +82,7 @@ def add_summary_text_image(header, summary, score=None):
 
     return new_img
 
+@metrics.instrument("steam_http")
 def get_request(url,parameters=None):
     """Return json-formatted response of a get request using optional parameters.
     
@@ -93,12 +111,13 @@ def get_request(url,parameters=None):
         return get_request(url, parameters)
     
     if response:
+        metrics.record_payload("steam_http", len(response.content))
         return response.json()
     else:
         # We do not know how many pages steamspy has... and it seems to work well, so we will use no response to stop.
         # response is none usually means too many requests. Wait and try again 
-        print('No response, waiting 10 seconds...')
-        time.sleep(10)
+        print(f'No response, waiting {RETRY_WAIT} seconds...')
+        time.sleep(RETRY_WAIT)
         print('Retrying.')
         return get_request(url, parameters)
     
@@ -112,10 +131,11 @@ def wrap_list_of_strings(strings, width=40, emoji=None):
         wrapped_strings.append(wrapped_string)
     return "\n".join(wrapped_strings)
 
+@metrics.instrument("steam_appdetails", appid_arg="appid")
 def get_header_image(appid):
     """Return the header image for a given appid."""
     try:
-        response = requests.get(f"http://store.steampowered.com/api/appdetails/?appids={appid}&filters=basic")
+        response = requests.get(f"{STEAM_APPDETAILS_URL}/api/appdetails/?appids={appid}&filters=basic")
         data = response.json()
         if data and str(appid) in data:
             img_url = data[str(appid)]["data"]["header_image"]
@@ -124,10 +144,11 @@ def get_header_image(appid):
     except Exception as e:
         return None
     
+@metrics.instrument("steam_appdetails", appid_arg="appid")
 def get_capsule_url(appid):
     """Return the capsule image for a given appid."""
     try:
-        response = requests.get(f"http://store.steampowered.com/api/appdetails/?appids={appid}&filters=basic")
+        response = requests.get(f"{STEAM_APPDETAILS_URL}/api/appdetails/?appids={appid}&filters=basic")
         data = response.json()
         if data and str(appid) in data:
             img_url = data[str(appid)]["data"]["capsule_image"]
@@ -135,10 +156,270 @@ def get_capsule_url(appid):
     except Exception as e:
         return None
     
+@metrics.instrument("steam_summary", appid_arg="appid")
 def get_summary(appid):
     """Return summary of reviews for a given appid."""
-    url = "https://store.steampowered.com/appreviews/" + str(appid)
+    url = f"{STEAM_STORE_URL}/appreviews/" + str(appid)
     parameters = {"json": 1, "purchase_type": "all", "review_type": "all"}
     json_data = get_request(url, parameters)
     json_data['query_summary']['appid'] = appid  # Add appid to the summary
-    return json_data['query_summary']
\ No newline at end of file
+    return json_data['query_summary']
+
+@metrics.count_cache("steam_app_list")
+@st.cache_data
+@metrics.instrument("steam_app_list")
+def get_steam_df():
+    """Return a list of all steam games.
+    
+    Returns
+    -------
+    
+        list of all steam games
+    """
+    return pd.DataFrame(get_request(f"{STEAM_API_URL}/ISteamApps/GetAppList/v2/?")["applist"]["apps"])
+
+def checks_review_availability(row):
+    row["total_reviews"] = get_reviews(row["appid"])
+    if row["total_reviews"] > 1000:
+        row["fuzzy_score"] += 5 # Boost score for popular games
+    elif row["total_reviews"] >= 50:
+        row["fuzzy_score"] += 2 # Boost score for games with enough reviews
+    return row["total_reviews"] > 0
+
+
+@metrics.count_cache("search")
+@st.cache_data
+@metrics.instrument("search")
+def get_steam_df_search(search_input):
+    """Return a DataFrame of steam games matching the search input.
+    """
+    df = get_steam_df().copy()
+    df["fuzzy_score"] = df["name"].apply(lambda x: fuzzy_phrase_match(x, search_input))
+    df["len_name"] = df["name"].apply(lambda x: -len(x))
+    df = df[df["fuzzy_score"] > 90]  # Filter out low fuzzy scores
+    df = df.sort_values(by=["fuzzy_score","len_name"], ascending=False)
+    valid_rows = []
+    counter = 0
+    for idx, row in df.iterrows():
+        if checks_review_availability(row):
+            valid_rows.append(row)
+            counter += 1
+        if counter == 30:
+            break
+    if counter > 0:
+        df = pd.DataFrame(valid_rows)
+        df = df.sort_values(by=["fuzzy_score","total_reviews"], ascending=False)
+        return df
+    else:
+        return None
+
+def fuzzy_phrase_match(text, target):
+    def get_fuzzy_score(text_words, target_words):
+        scores = []
+        start_word= 0
+        for tw in target_words:
+            # Calculate the fuzzy score for each word in the target against all words in the text in order
+            word_scores = [(fuzz.ratio(tw, word)) for word in text_words[start_word:]]
+            best_score = max(word_scores) if word_scores else 0
+            if best_score > 0:
+                start_word += word_scores.index(best_score) + 1
+            scores.append(best_score)
+        avg_score = sum(scores) / len(scores)
+        return avg_score
+    #re.sub('[^\w\s]', '', x).lower(), re.sub('[^\w\s]', '', search_input).lower(), threshold=90)
+    target_words = target.lower().split()
+    text_words = text.lower().split()
+    score_0 = get_fuzzy_score(text_words, target_words)
+    score_1 = 0
+    if bool(re.search(r'[^a-zA-Z0-9]', text)):
+        # If there is punctuation, we will try to match without it
+        target_words = re.sub('[^\w\s]', '', target).lower().split()
+        text_words = re.sub('[^\w\s]', '', text).lower().split()
+        score_1 = get_fuzzy_score(text_words, target_words) - 2
+    return max(score_0, score_1)
+
+def get_reviews(appid):
+    """Return if there are reviews for a given appid."""
+    return get_summary(appid)['total_reviews']
+
+Base = declarative_base()
+
+class Summary(Base):
+    __tablename__ = "summaries"
+    appid = Column(String, primary_key=True)
+    summary_date = Column(DateTime)
+    total_reviews = Column(Integer)
+    json_object = Column(String)
+    reviews = Column(String)
+    times_consulted = Column(Integer)
+    bug = Column(Boolean)
+
+class Report(Base):
+    __tablename__ = "summary_bug"
+    appid = Column(String, primary_key=True)
+    summary_date = Column(DateTime)
+    report_date = Column(DateTime)
+    json_object_bug = Column(String)
+    times_consulted = Column(Integer)
+    reason = Column(String)
+
+def get_connection():
+    """Return the connection to the database caching the AI summaries."""
+    return st.connection("neon", type="sql")
+
+def check_fresh_summary(result, total_reviews):
+    check_summary = result.json_object is not None
+    check_date = result.summary_date >= datetime.now()-timedelta(days=30)
+    check_reviews = result.total_reviews >= total_reviews*0.9
+    return check_date & check_reviews & check_summary
+
+@metrics.instrument("summary", appid_arg="target_appid")
+def manage_summary_by_appid(target_appid: str, total_reviews: int, progress_status):
+    date_cache = None
+    with metrics.track("db_read"):
+        try:
+            #st.write("Connecting to database... try 1")
+            conn = get_connection()
+            session = conn.session
+            result = session.get(Summary, target_appid)
+        except Exception as e:
+            metrics.record_retry("db_read")
+            time.sleep(5)  # Wait for a while before retrying
+            #st.write(f"Retrying connection to database... Error: {e}")
+            conn = get_connection()
+            session = conn.session
+            result = session.get(Summary, target_appid)
+    json_summary = None
+    if result is not None:
+        if check_fresh_summary(result, total_reviews) and result.bug is False and result.reviews is not None:
+            metrics.record_cache("summary", hit=True)
+            json_summary = result.json_object
+            reviews = json.loads(result.reviews)
+            result.times_consulted += 1
+            date_cache = result.summary_date
+            with metrics.track("db_write"):
+                session.commit()
+        else:
+            metrics.record_cache("summary", hit=False)
+            progress_status.write("### Generating summary with AI...")
+            json_ai, reviews = get_summary_reviews_ai(target_appid)
+            result.json_object = json_ai
+            result.total_reviews = total_reviews
+            result.reviews = json.dumps(reviews)
+            result.times_consulted += 1
+            result.summary_date = datetime.now()
+            result.bug = False
+            with metrics.track("db_write"):
+                session.commit()
+            json_summary = json_ai
+    else:
+        metrics.record_cache("summary", hit=False)
+        json_ai, reviews = get_summary_reviews_ai(target_appid)
+        new_summary = Summary(appid=target_appid, summary_date=datetime.now(), total_reviews=total_reviews, json_object=json_ai, reviews=json.dumps(reviews), times_consulted=1, bug = False)
+        with metrics.track("db_write"):
+            session.add(new_summary)
+            session.commit()
+        json_summary = json_ai
+    session.close()
+    return json_summary, date_cache, reviews
+
+@metrics.instrument("db_write_bug", appid_arg="appid")
+def write_bug(appid, content, option_bug):
+    """Write a bug report to the database."""
+    try:
+        conn = get_connection()
+        session = conn.session
+        result = session.get(Summary, str(appid))
+    except Exception as e:
+        metrics.record_retry("db_write_bug")
+        time.sleep(5)  # Wait for a while before retrying
+        conn = get_connection()
+        session = conn.session
+        result = session.get(Summary, str(appid))
+    
+    if result is not None:
+        result.bug = True
+        report = Report(appid=str(appid),
+                        summary_date=result.summary_date,
+                        report_date=datetime.now(),
+                        json_object_bug=json.dumps(content),
+                        times_consulted=result.times_consulted,
+                        reason=option_bug)
+        session.add(report)
+        session.commit()
+    else:
+        st.write("No summary found for this appid.")
+    session.close()
+
+@metrics.count_cache("steam_reviews", appid_arg="appid")
+@st.cache_data
+@metrics.instrument("steam_reviews", appid_arg="appid")
+def parse_steamreviews_request(appid):
+    num_per_page = 20
+    max_review = 20  # max number of reviews to return
+    review_count = 0
+    reviews_json = {}
+    url = f"{STEAM_STORE_URL}/appreviews/" + str(appid)
+    print(url)
+    parameters = {
+        "json": 1,
+        "cursor": "*",
+        "num_per_page": num_per_page,
+        "language": "english",
+        "purchase_type": "all",
+        "review_type": "all",
+        "day_range": "365"
+    }
+    json_data = get_request(url, parameters)
+    summary = json_data['query_summary']
+    review_id = 1
+    while review_count < max_review:
+        if summary["num_reviews"] == 0:
+            break
+        json_data = get_request(url, parameters)
+        for review in json_data["reviews"]:
+            review_count += 1
+            sentiment = "positive" if review["voted_up"] else "negative"
+            reviews_json[str(review_id)] = {
+                "review": review["review"],
+                "sentiment": sentiment
+            }
+            review_id += 1
+        parameters["cursor"] = json_data["cursor"]
+        summary = json_data['query_summary']
+    return reviews_json, summary
+
+@st.cache_resource
+def get_client():
+    """Return the Mistral client used to summarise the reviews."""
+    return Mistral(st.secrets["MISTRAL_API_KEY"])
+
+def get_agent_id():
+    """Return the id of the Mistral agent that summarises the reviews."""
+    return st.secrets["review_agent_cot"]
+
+@metrics.instrument("llm")
+def get_json_response(reviews):
+    try:
+        response = get_client().agents.complete(
+            agent_id=get_agent_id(),
+            messages=reviews,
+            stream=False,
+            response_format={"type": "json_object"}
+            )
+        if response is None or not hasattr(response, 'choices') or not response.choices:
+            return get_json_response(reviews)  # Retry if no response or empty choices
+        return response    
+    except Exception as e:
+        st.write(f"Error during web search: {str(e)}")
+        return 0
+
+def get_summary_reviews_ai(appid):
+    json_reviews, summary = parse_steamreviews_request(appid)
+    prompt = json.dumps(json_reviews)
+    metrics.record_payload("llm_request", len(prompt.encode()))
+    raw_response = get_json_response([{"content": prompt, "role": "user"}])
+    
+    content_raw = raw_response.choices[0].message.content
+    metrics.record_payload("llm_response", len(content_raw.encode()))
+    return content_raw, json_reviews